@@ -1,27 +1,48 @@
 import streamlit as st
 import os
-from PIL import Image
-import numpy as np
 
-# Suppress TensorFlow oneDNN logs
-os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
-
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array
-from tensorflow.keras.applications.vgg16 import preprocess_input
+from inference import MODEL_PATH, class_labels, load_mri_model
+from ingest import UploadRejected, load_upload
+from cascade import load_cascade
+from jobs import JobQueue, QueueFullError
+from retrieval import DEFAULT_INDEX_DIR, open_case_index
 
 # Load the trained model
 @st.cache_resource
 def load_prediction_model():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(base_dir, 'models', 'mri_model.h5')
-    if not os.path.exists(model_path):
-        st.error(f"Model file not found at: {model_path}")
+    if not os.path.exists(MODEL_PATH):
+        st.error(f"Model file not found at: {MODEL_PATH}")
         st.stop()
-    return load_model(model_path, compile=False, safe_mode=False)
+    return load_mri_model(MODEL_PATH)
 
 model = load_prediction_model()
-class_labels = ['glioma', 'meningioma', 'notumor', 'pituitary']
+
+# Similar-case index built offline with retrieval.py (optional)
+@st.cache_resource
+def load_case_index():
+    try:
+        return open_case_index(DEFAULT_INDEX_DIR, MODEL_PATH)
+    except ValueError as e:
+        st.warning(f"Similar-case search disabled: {e}")
+        return None
+
+case_index = load_case_index()
+
+# Optional cheap first-stage model; only low-confidence scans reach the full model
+@st.cache_resource
+def load_prediction_cascade():
+    return load_cascade()
+
+cascade = load_prediction_cascade()
+
+# Background analysis queue; workers share the cached model
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(model_loader=lambda: model, case_index=case_index, cascade=cascade).start()
+
+job_queue = get_job_queue()
+
+PREVIEW_SIZE = 400
 
 # Treatment recommendations with detailed steps
 treatments = {
@@ -173,6 +194,129 @@ treatments = {
     }
 }
 
+def display_analysis(prediction):
+    result = prediction['result']
+
+    # Display results in modern cards
+    if result == 'notumor':
+        st.markdown("""
+        <div class="success-message">
+            <h3 style="margin-top: 0;">✅ No Tumor Detected</h3>
+            <p>The AI analysis indicates no tumor presence in the MRI scan.</p>
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        st.markdown(f"""
+        <div class="feature-card">
+            <h3 style="color: #FF6B35; text-align: center;">⚠️ Tumor Detected: {result.title()}</h3>
+        </div>
+        """, unsafe_allow_html=True)
+
+    # Confidence Score
+    st.markdown("### 📊 Analysis Confidence")
+    confidence_percentage = prediction['confidence'] * 100
+    st.markdown(f"""
+    <div class="stat-card" style="margin: 1rem 0;">
+        <div class="stat-number">{confidence_percentage:.1f}%</div>
+        <div class="stat-label">AI Confidence Level</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Progress bar for confidence
+    st.progress(int(confidence_percentage))
+    if prediction.get('stage') == 'fast':
+        st.caption("⚡ Decided by the fast screening model (high confidence)")
+    elif cascade is not None:
+        st.caption("🧠 Escalated to the full VGG16 model")
+
+    # Similar prior cases from the reference archive
+    if 'similar_cases' in prediction and prediction['similar_cases'] is None:
+        st.markdown("### 🗂️ Similar Prior Cases")
+        st.info("Similar-case search was skipped: it only runs for scans escalated to the full model, "
+                "and this scan was decided by the fast screening model.")
+    elif prediction.get('similar_cases'):
+        st.markdown("### 🗂️ Similar Prior Cases")
+        st.table([
+            {
+                'Case': os.path.basename(case['path']),
+                'Diagnosis': case['label'].title(),
+                'Similarity': f"{case['similarity'] * 100:.1f}%",
+            }
+            for case in prediction['similar_cases']
+        ])
+
+    # Display treatment information
+    treatment_info = treatments[result]
+    st.markdown("### 🏥 Treatment Recommendations")
+    st.markdown(f"""
+    <div class="treatment-card">
+        <h3 class="treatment-title">{treatment_info['title']}</h3>
+        <p style="text-align: center; color: #E0E0E0; margin-bottom: 2rem;">{treatment_info['overview']}</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Treatment Steps
+    st.markdown("#### 📋 Detailed Treatment Protocol")
+    for step in treatment_info['steps']:
+        st.markdown(f"""
+        <div class="step-item">
+            {step}
+        </div>
+        """, unsafe_allow_html=True)
+
+    # Treatment Summary
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown(f"""
+        <div class="stat-card">
+            <div class="stat-label">Expected Duration</div>
+            <div class="stat-number" style="font-size: 1rem;">{treatment_info['duration']}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    with col2:
+        st.markdown(f"""
+        <div class="stat-card">
+            <div class="stat-label">Success Rate</div>
+            <div class="stat-number" style="font-size: 1rem;">{treatment_info['success_rate']}</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    # Medical Disclaimer
+    st.markdown("""
+    <div class="warning-message">
+        <strong>⚠️ Important Medical Disclaimer:</strong><br>
+        This AI analysis is for educational and research purposes only. The results should not be used as a definitive medical diagnosis. Always consult with qualified healthcare professionals for proper medical evaluation and treatment planning. Early consultation with specialists is crucial for optimal patient outcomes.
+    </div>
+    """, unsafe_allow_html=True)
+
+def show_job(job_id):
+    st.markdown(f"**Analysis ID:** `{job_id}`")
+    status_text = st.empty()
+    progress_bar = st.progress(0)
+    with st.spinner("🧠 AI is analyzing your MRI scan..."):
+        for job in job_queue.wait(job_id):
+            if job is None:
+                progress_bar.empty()
+                st.error("Analysis not found. It may have been submitted to a different server.")
+                return
+            if job['status'] == 'queued':
+                status_text.markdown(f"⏳ Waiting in queue ({job['position']} ahead)")
+            else:
+                status_text.markdown(f"🔄 Analyzed {job['completed']} of {job['total']} image(s)")
+            progress_bar.progress(min(100, int(100 * job['completed'] / job['total'])))
+    status_text.empty()
+    progress_bar.empty()
+
+    if job['status'] == 'failed':
+        st.error(f"Error processing the image: {job['error']}")
+        return
+    for item in job['items']:
+        if item['error']:
+            st.error(f"{item['name']}: {item['error']}")
+        else:
+            st.markdown(f"#### 📄 {item['name']}")
+            display_analysis(item['result'])
+
 def main():
     # Page Configuration
     st.set_page_config(
@@ -411,6 +555,7 @@ def main():
     app_mode = st.sidebar.selectbox(
         "Choose Section",
         ["🏠 Home", "🔬 Disease Detection", "ℹ️ About"],
+        key='app_mode',
         help="Navigate through different sections of the application"
     )
     st.markdown('</div>', unsafe_allow_html=True)
@@ -547,7 +692,23 @@ def main():
         )
         st.markdown('</div>', unsafe_allow_html=True)
 
+        # A new, removed or re-selected upload means the previous result no longer applies
+        upload_id = uploaded_file.file_id if uploaded_file is not None else None
+        if st.session_state.get('upload_id') != upload_id:
+            st.session_state['upload_id'] = upload_id
+            st.session_state.pop('job_id', None)
+            if 'job' in st.query_params:
+                del st.query_params['job']
+
+        # Validate the upload from its header and decode only a preview-sized copy
+        preview = None
         if uploaded_file is not None:
+            try:
+                preview = load_upload(uploaded_file, PREVIEW_SIZE)
+            except UploadRejected as e:
+                st.error(f"❌ {e}")
+
+        if preview is not None:
             # Display the uploaded image in a modern card
             st.markdown("### 🖼️ Uploaded Image Preview")
             col1, col2, col3 = st.columns([1, 2, 1])
@@ -555,9 +716,9 @@ def main():
                 st.markdown("""
                 <div class="feature-card" style="text-align: center;">
                 """, unsafe_allow_html=True)
-                st.image(uploaded_file, caption="📊 MRI Brain Scan", width=400, use_column_width=True)
+                st.image(preview, caption="📊 MRI Brain Scan", width=400, use_column_width=True)
                 st.markdown(f"**File:** {uploaded_file.name}")
-                st.markdown(f"**Size:** {len(uploaded_file.getvalue()) / 1024:.1f} KB")
+                st.markdown(f"**Size:** {uploaded_file.size / 1024:.1f} KB")
                 st.markdown('</div>', unsafe_allow_html=True)
 
             # Analysis Button
@@ -565,100 +726,18 @@ def main():
             col1, col2, col3 = st.columns([1, 1, 1])
             with col2:
                 if st.button("🔍 Analyze Image", type="primary", use_container_width=True):
-                    with st.spinner("🧠 AI is analyzing your MRI scan..."):
-                        # Progress bar
-                        progress_bar = st.progress(0)
-                        for i in range(100):
-                            progress_bar.progress(i + 1)
-                            import time
-                            time.sleep(0.01)
-
-                        # Process the image
-                        image = Image.open(uploaded_file).convert('RGB')
-                        img = image.resize((128, 128))
-                        img_array = np.array(img) / 255.0
-                        img_array = np.expand_dims(img_array, axis=0)
-
-                        # Make prediction
-                        predictions = model.predict(img_array)
-                        predicted_class_index = np.argmax(predictions, axis=1)[0]
-                        confidence_score = np.max(predictions, axis=1)[0]
-                        result = class_labels[predicted_class_index]
-
-                        # Clear progress bar
-                        progress_bar.empty()
-
-                        # Display results in modern cards
-                        if result == 'notumor':
-                            st.markdown("""
-                            <div class="success-message">
-                                <h3 style="margin-top: 0;">✅ No Tumor Detected</h3>
-                                <p>The AI analysis indicates no tumor presence in the MRI scan.</p>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        else:
-                            st.markdown(f"""
-                            <div class="feature-card">
-                                <h3 style="color: #FF6B35; text-align: center;">⚠️ Tumor Detected: {result.title()}</h3>
-                            </div>
-                            """, unsafe_allow_html=True)
-
-                        # Confidence Score
-                        st.markdown("### 📊 Analysis Confidence")
-                        confidence_percentage = confidence_score * 100
-                        st.markdown(f"""
-                        <div class="stat-card" style="margin: 1rem 0;">
-                            <div class="stat-number">{confidence_percentage:.1f}%</div>
-                            <div class="stat-label">AI Confidence Level</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-
-                        # Progress bar for confidence
-                        st.progress(int(confidence_percentage))
-
-                        # Display treatment information
-                        treatment_info = treatments[result]
-                        st.markdown("### 🏥 Treatment Recommendations")
-                        st.markdown(f"""
-                        <div class="treatment-card">
-                            <h3 class="treatment-title">{treatment_info['title']}</h3>
-                            <p style="text-align: center; color: #E0E0E0; margin-bottom: 2rem;">{treatment_info['overview']}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-
-                        # Treatment Steps
-                        st.markdown("#### 📋 Detailed Treatment Protocol")
-                        for step in treatment_info['steps']:
-                            st.markdown(f"""
-                            <div class="step-item">
-                                {step}
-                            </div>
-                            """, unsafe_allow_html=True)
-
-                        # Treatment Summary
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.markdown(f"""
-                            <div class="stat-card">
-                                <div class="stat-label">Expected Duration</div>
-                                <div class="stat-number" style="font-size: 1rem;">{treatment_info['duration']}</div>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        with col2:
-                            st.markdown(f"""
-                            <div class="stat-card">
-                                <div class="stat-label">Success Rate</div>
-                                <div class="stat-number" style="font-size: 1rem;">{treatment_info['success_rate']}</div>
-                            </div>
-                            """, unsafe_allow_html=True)
-
-                        # Medical Disclaimer
-                        st.markdown("""
-                        <div class="warning-message">
-                            <strong>⚠️ Important Medical Disclaimer:</strong><br>
-                            This AI analysis is for educational and research purposes only. The results should not be used as a definitive medical diagnosis. Always consult with qualified healthcare professionals for proper medical evaluation and treatment planning. Early consultation with specialists is crucial for optimal patient outcomes.
-                        </div>
-                        """, unsafe_allow_html=True)
+                    try:
+                        job_id = job_queue.submit([(uploaded_file.name, uploaded_file.getvalue())])
+                    except QueueFullError as e:
+                        st.warning(f"⏳ {e}")
+                    else:
+                        st.session_state['job_id'] = job_id
+                        st.query_params['job'] = job_id
+
+        # Follow the submitted job; the ID in the URL lets a reconnecting browser pick it up again
+        job_id = st.session_state.get('job_id') or st.query_params.get('job')
+        if job_id:
+            show_job(job_id)
 
     elif app_mode == "ℹ️ About":
         st.markdown("""
@@ -0,0 +1,237 @@
+"""Offline bulk scoring of image archives with resumable, parallel execution.
+
+Walks a directory tree, decodes images in a bounded prefetching thread pool
+(through the same upload guard as the app) and runs batched inference with
+the app's model and ``class_labels``. Results are written incrementally as
+numbered part files (CSV, or Parquet with pyarrow) in the output directory.
+
+After each part is safely on disk its files, followed by a commit line, are
+appended to ``manifest.tsv``; a restarted run skips everything in committed
+blocks and deletes any part file that was never committed, so nothing is
+scored or written twice. The manifest also records the model version and
+output format, and a resume with a different ``--model`` or ``--format`` is
+refused. Images that failed to decode are kept as error rows; pass
+``--retry-errors`` to score them again (their new rows land in a later part,
+so for a repeated path the highest-numbered part wins).
+
+Example:
+    python bulk_score.py /data/exported_slices --output-dir scores/ --format parquet
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dataset import IMAGE_EXTENSIONS
+from inference import MODEL_PATH, class_labels, load_mri_model, model_version, predict_batch, preprocess_image
+from ingest import load_upload
+
+MANIFEST_FILE = 'manifest.tsv'
+COMMIT_MARKER = '#commit'
+CONFIG_MARKER = '#config'
+FIELDS = ['path', 'prediction', 'confidence'] + [f'prob_{label}' for label in class_labels] + \
+    ['model_version', 'decode_ms', 'inference_ms', 'error']
+
+
+def find_images(root):
+    """Yield absolute image paths under ``root`` in a stable (sorted) order."""
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def read_manifest(output_dir):
+    """Return (run config, completed paths, errored paths, committed part names) from the manifest.
+
+    The first line records the run's config as JSON. Each part's block of
+    ``part<TAB>status<TAB>path`` lines ends with a ``COMMIT_MARKER`` line.
+    Anything after the last marker was cut off mid-write, so it is ignored
+    and truncated away before new entries are appended.
+    """
+    config, done, failed, parts = None, set(), set(), set()
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return config, done, failed, parts
+    committed_bytes = read_bytes = 0
+    block = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            read_bytes += len(line)
+            fields = line.decode('utf-8').rstrip('\n').split('\t', 2)
+            if fields[0] == CONFIG_MARKER:
+                config = json.loads(fields[1])
+                committed_bytes = read_bytes
+            elif fields[0] == COMMIT_MARKER:
+                parts.add(fields[1])
+                for status, image_path in block:
+                    done.add(image_path)
+                    if status == 'error':
+                        failed.add(image_path)
+                    else:
+                        failed.discard(image_path)
+                block = []
+                committed_bytes = read_bytes
+            else:
+                block.append((fields[1], fields[2]))
+    if committed_bytes != os.path.getsize(path):
+        os.truncate(path, committed_bytes)
+    return config, done, failed, parts
+
+
+def remove_uncommitted_parts(output_dir, committed_parts):
+    for name in os.listdir(output_dir):
+        if name.startswith('part-') and name not in committed_parts:
+            os.remove(os.path.join(output_dir, name))
+
+
+def decode(path):
+    """Read and preprocess one image; returns (path, array or None, decode_ms, error)."""
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            img_array = preprocess_image(load_upload(f.read()))
+        return path, img_array, (time.perf_counter() - start) * 1000, ''
+    except Exception as e:
+        return path, None, (time.perf_counter() - start) * 1000, str(e)
+
+
+def score_batch(model, version, decoded):
+    """Run the model on the successfully decoded images of a batch and build result rows."""
+    ok = [item for item in decoded if item[1] is not None]
+    start = time.perf_counter()
+    probabilities = predict_batch(model, [img_array for _, img_array, _, _ in ok]) if ok else []
+    per_image_ms = (time.perf_counter() - start) * 1000 / max(len(ok), 1)
+    probabilities = dict(zip((path for path, _, _, _ in ok), probabilities))
+
+    rows = []
+    for path, _, decode_ms, error in decoded:
+        row = dict.fromkeys(FIELDS)
+        row.update(path=path, model_version=version, decode_ms=round(decode_ms, 2), error=error)
+        if path in probabilities:
+            probs = probabilities[path]
+            best = int(probs.argmax())
+            row.update(prediction=class_labels[best], confidence=float(probs[best]),
+                       inference_ms=round(per_image_ms, 2))
+            row.update({f'prob_{label}': float(p) for label, p in zip(class_labels, probs)})
+        rows.append(row)
+    return rows
+
+
+def write_part(output_dir, part_name, rows, fmt):
+    """Write one part file atomically (temp file + rename)."""
+    final_path = os.path.join(output_dir, part_name)
+    tmp_path = os.path.join(output_dir, '.' + part_name + '.tmp')
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # Explicit schema so parts whose rows all failed to decode still match the others
+        text_fields = ('path', 'prediction', 'model_version', 'error')
+        schema = pa.schema([(name, pa.string() if name in text_fields else pa.float64()) for name in FIELDS])
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), tmp_path)
+    else:
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, final_path)
+
+
+def commit_part(output_dir, manifest, part_index, rows, fmt):
+    """Write a part file, then record its images in the manifest so a restart skips them."""
+    part_name = f"part-{part_index:05d}.{fmt}"
+    write_part(output_dir, part_name, rows, fmt)
+    manifest.write(''.join(f"{part_name}\t{'error' if row['error'] else 'ok'}\t{row['path']}\n" for row in rows)
+                   + f"{COMMIT_MARKER}\t{part_name}\n")
+    manifest.flush()
+    os.fsync(manifest.fileno())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every image under a directory with the MRI model.")
+    parser.add_argument('input_dir')
+    parser.add_argument('--output-dir', required=True, help="Directory for part files and the resume manifest")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--part-size', type=int, default=4096, help="Images per output part file (rounded up to whole batches)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="Image decoding threads")
+    parser.add_argument('--prefetch', type=int, default=4, help="Batches decoded ahead of inference")
+    parser.add_argument('--report-every', type=float, default=10.0, help="Seconds between progress lines")
+    parser.add_argument('--retry-errors', action='store_true', help="Score images that failed in earlier runs again")
+    args = parser.parse_args()
+
+    if args.format == 'parquet':
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            parser.error("--format parquet requires the pyarrow package")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    version = model_version(args.model)
+    run_config = {'model_version': version, 'format': args.format}
+    config, done, failed, committed_parts = read_manifest(args.output_dir)
+    # Parts from another model or format must not be mixed into the same output
+    if config is not None and config != run_config:
+        parser.error(f"{args.output_dir} holds {config['format']} results from {config['model_version']}, "
+                     f"not {args.format} results from {version}; use a new --output-dir")
+    remove_uncommitted_parts(args.output_dir, committed_parts)
+    if args.retry_errors:
+        done -= failed
+    todo = [path for path in find_images(args.input_dir) if path not in done]
+    print(f"{len(done)} images already scored ({len(failed & done)} with errors), {len(todo)} to go")
+    if not todo:
+        return
+
+    model = load_mri_model(args.model)
+    batches = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    part_index = len(committed_parts)
+    pending_rows = []
+    scored = 0
+    start = last_report = time.perf_counter()
+    last_scored = 0
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool, \
+            open(os.path.join(args.output_dir, MANIFEST_FILE), 'a', encoding='utf-8') as manifest:
+        if config is None:
+            manifest.write(f"{CONFIG_MARKER}\t{json.dumps(run_config)}\n")
+        # Keep up to `prefetch` batches decoding while the model works on the current one
+        in_flight = deque()
+        next_batch = 0
+        while in_flight or next_batch < len(batches):
+            while next_batch < len(batches) and len(in_flight) < args.prefetch:
+                in_flight.append([pool.submit(decode, path) for path in batches[next_batch]])
+                next_batch += 1
+            decoded = [future.result() for future in in_flight.popleft()]
+            pending_rows.extend(score_batch(model, version, decoded))
+            scored += len(decoded)
+
+            if len(pending_rows) >= args.part_size:
+                commit_part(args.output_dir, manifest, part_index, pending_rows, args.format)
+                part_index += 1
+                pending_rows = []
+
+            now = time.perf_counter()
+            if now - last_report >= args.report_every:
+                print(f"{len(done) + scored}/{len(done) + len(todo)} images | "
+                      f"{(scored - last_scored) / (now - last_report):.1f} img/s now, "
+                      f"{scored / (now - start):.1f} img/s overall")
+                last_report, last_scored = now, scored
+
+        if pending_rows:
+            commit_part(args.output_dir, manifest, part_index, pending_rows, args.format)
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} images in {elapsed:.1f}s ({scored / elapsed:.1f} img/s); results in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
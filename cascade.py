@@ -0,0 +1,113 @@
+"""Confidence-gated two-stage cascade in front of the full model.
+
+A cheap first-stage model (e.g. the distilled student from ``distill.py``)
+classifies every scan; only scans whose top-class probability falls below the
+threshold are escalated to the full VGG16 model. Enable it in the app with
+``MRI_CASCADE_MODEL_PATH`` and ``MRI_CASCADE_THRESHOLD``.
+
+Running this module picks the threshold from validation data:
+    python cascade.py --val-dir "MRI Images/Testing" --fast-model models/mri_student.h5
+"""
+import argparse
+import json
+import os
+import numpy as np
+
+from dataset import list_labeled_images, load_images, report_rejected
+from inference import MODEL_PATH, STUDENT_MODEL_PATH, load_mri_model, predict_batch
+
+CASCADE_MODEL_PATH = os.environ.get('MRI_CASCADE_MODEL_PATH')
+CASCADE_THRESHOLD = float(os.environ.get('MRI_CASCADE_THRESHOLD', '0.95'))
+CANDIDATE_THRESHOLDS = [0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.97, 0.98, 0.99, 0.995, 0.999]
+
+
+class Cascade:
+    """First stage of the cascade: answers only when its top-class probability reaches ``threshold``."""
+
+    def __init__(self, fast_model, threshold=CASCADE_THRESHOLD):
+        self.fast_model = fast_model
+        self.threshold = threshold
+
+    def first_stage(self, img_array):
+        """Return the fast model's probabilities for one image, or None to escalate."""
+        probabilities = predict_batch(self.fast_model, [img_array])[0]
+        if probabilities.max() >= self.threshold:
+            return probabilities
+        return None
+
+
+def load_cascade(model_path=CASCADE_MODEL_PATH, threshold=CASCADE_THRESHOLD):
+    """Load the configured cascade, or return None when no first-stage model is set."""
+    if not model_path:
+        return None
+    return Cascade(load_mri_model(model_path), threshold)
+
+
+def sweep_thresholds(labels, fast_probs, full_probs, fast_ms, full_ms, thresholds=CANDIDATE_THRESHOLDS):
+    """Accuracy, escalation rate and expected per-scan latency of the cascade at each threshold."""
+    fast_confidence = fast_probs.max(axis=1)
+    rows = []
+    for threshold in thresholds:
+        escalated = fast_confidence < threshold
+        predictions = np.where(escalated, full_probs.argmax(axis=1), fast_probs.argmax(axis=1))
+        rows.append({
+            'threshold': threshold,
+            'escalation_rate': float(escalated.mean()),
+            'accuracy': float(np.mean(predictions == labels)),
+            'avg_latency_ms': fast_ms + float(escalated.mean()) * full_ms,
+        })
+    return rows
+
+
+def main():
+    # evaluation pulls in scikit-learn, which the serving image does not need
+    from evaluation import serving_latency_ms
+
+    parser = argparse.ArgumentParser(description="Choose the cascade confidence threshold from validation data.")
+    parser.add_argument('--val-dir', required=True, help="Validation images, one sub-directory per class")
+    parser.add_argument('--fast-model', default=STUDENT_MODEL_PATH)
+    parser.add_argument('--full-model', default=MODEL_PATH)
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.005,
+                        help="Largest accuracy loss vs. the full model accepted when recommending a threshold")
+    parser.add_argument('--report', help="Write the threshold sweep to this JSON file")
+    args = parser.parse_args()
+
+    fast_model = load_mri_model(args.fast_model)
+    full_model = load_mri_model(args.full_model)
+    paths, labels = list_labeled_images(args.val_dir)
+    images, rejected = load_images(paths)
+    report_rejected(rejected)
+    labels = labels[[path not in rejected for path in paths]]
+    fast_probs = fast_model.predict(images, verbose=0)
+    full_probs = full_model.predict(images, verbose=0)
+    # Time both models per scan through predict_batch, as analyze_image calls them when serving
+    fast_ms = serving_latency_ms(fast_model, images[0])
+    full_ms = serving_latency_ms(full_model, images[0])
+
+    full_accuracy = float(np.mean(full_probs.argmax(axis=1) == labels))
+    rows = sweep_thresholds(labels, fast_probs, full_probs, fast_ms, full_ms)
+    print(f"Full model: accuracy {full_accuracy:.4f}, {full_ms:.1f} ms/scan; first stage: {fast_ms:.1f} ms/scan")
+    print(f"{'threshold':>9} {'escalated':>9} {'accuracy':>9} {'avg ms':>8} {'speedup':>8}")
+    print(f"{'off':>9} {'-':>9} {full_accuracy:>9.4f} {full_ms:>8.1f} {1:>7.1f}x")
+    for row in rows:
+        print(f"{row['threshold']:>9} {row['escalation_rate']:>9.1%} {row['accuracy']:>9.4f} "
+              f"{row['avg_latency_ms']:>8.1f} {full_ms / row['avg_latency_ms']:>7.1f}x")
+
+    # The cascade only pays off if it is faster than the full model alone at acceptable accuracy
+    acceptable = [row for row in rows if row['accuracy'] >= full_accuracy - args.max_accuracy_drop
+                  and row['avg_latency_ms'] < full_ms]
+    if acceptable:
+        best = min(acceptable, key=lambda row: row['avg_latency_ms'])
+        print(f"Recommended: MRI_CASCADE_THRESHOLD={best['threshold']} "
+              f"(accuracy {best['accuracy']:.4f}, {best['avg_latency_ms']:.1f} ms/scan)")
+    else:
+        print(f"No threshold is faster than the full model alone while keeping accuracy within "
+              f"{args.max_accuracy_drop:.1%}; leave MRI_CASCADE_MODEL_PATH unset")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'full_accuracy': full_accuracy, 'fast_ms': fast_ms, 'full_ms': full_ms, 'thresholds': rows},
+                      f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import random
+from PIL import ImageEnhance
+import numpy as np
+
+from inference import IMAGE_SIZE, class_labels, preprocess_image
+from ingest import UploadRejected, load_upload
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def list_labeled_images(data_dir):
+    """Collect (paths, label indices) from a ``data_dir/<class_label>/<image>`` tree, as used in training."""
+    paths, labels = [], []
+    for label_index, label in enumerate(class_labels):
+        label_dir = os.path.join(data_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for name in sorted(os.listdir(label_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(label_dir, name))
+                labels.append(label_index)
+    if not paths:
+        raise FileNotFoundError(f"No images found under {data_dir} for classes {class_labels}")
+    return paths, np.array(labels)
+
+
+# Image Augmentation Function (same brightness/contrast/sharpness jitter as models/MRI.ipynb)
+def augment_image(image):
+    image = ImageEnhance.Brightness(image).enhance(random.uniform(0.8, 1.2))
+    image = ImageEnhance.Contrast(image).enhance(random.uniform(0.8, 1.2))
+    image = ImageEnhance.Sharpness(image).enhance(random.uniform(0.8, 1.2))
+    return image
+
+
+def load_images(paths, augment=False):
+    """Load images as a float32 (N, 128, 128, 3) array scaled to [0, 1].
+
+    Files go through the same upload guard, decoding and preprocessing as the
+    app, so offline metrics, cascade thresholds and index embeddings are
+    computed on exactly the arrays the served model sees. Files the guard
+    rejects are skipped rather than stopping the run: returns ``(images,
+    rejected)``, where ``rejected`` maps each skipped path to the reason and
+    ``images`` holds the remaining files in order.
+    """
+    images, rejected = [], {}
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                img = load_upload(f.read())
+        except (OSError, UploadRejected) as e:
+            rejected[path] = str(e)
+            continue
+        if augment:
+            img = augment_image(img.resize((IMAGE_SIZE, IMAGE_SIZE)))
+        images.append(preprocess_image(img))
+    return np.array(images, dtype=np.float32).reshape(-1, IMAGE_SIZE, IMAGE_SIZE, 3), rejected
+
+
+def report_rejected(rejected):
+    """Print one line per file ``load_images`` skipped."""
+    for path, reason in rejected.items():
+        print(f"Skipped {path}: {reason}")
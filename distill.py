@@ -0,0 +1,145 @@
+"""Distill the VGG16 production model into a small student CNN for CPU serving.
+
+The teacher (``models/mri_model.h5``) labels each augmented training batch on
+the fly; the student is trained on a mix of the teacher's temperature-softened
+probabilities and the true labels. Teacher and student are then compared on
+the test set (accuracy, per-class AUC, parameter count, per-scan latency).
+
+The saved student takes the same 128x128 [0, 1] RGB input and returns the
+same four softmax outputs, so the app can serve it by pointing
+``MRI_MODEL_PATH`` at it.
+
+Example:
+    python distill.py --train-dir "MRI Images/Training" --test-dir "MRI Images/Testing"
+"""
+import argparse
+import json
+import os
+import random
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications import MobileNetV2
+from tensorflow.keras.layers import (Activation, BatchNormalization, Conv2D, Dense, Dropout,
+                                     GlobalAveragePooling2D, Input, MaxPooling2D, ReLU,
+                                     Rescaling, SeparableConv2D)
+from tensorflow.keras.models import Model
+from tensorflow.keras.optimizers import Adam
+
+from dataset import list_labeled_images, load_images, report_rejected
+from evaluation import model_report, print_comparison
+from inference import IMAGE_SIZE, MODEL_PATH, STUDENT_MODEL_PATH, class_labels, load_mri_model
+
+
+def build_student(architecture='small'):
+    """Student classifier ending in a named ``logits`` layer followed by softmax."""
+    inputs = Input(shape=(IMAGE_SIZE, IMAGE_SIZE, 3))
+    if architecture == 'mobilenet':
+        # MobileNetV2 expects inputs in [-1, 1]; the app feeds [0, 1]
+        x = Rescaling(2.0, offset=-1.0)(inputs)
+        x = MobileNetV2(input_shape=(IMAGE_SIZE, IMAGE_SIZE, 3), alpha=0.35,
+                        include_top=False, weights='imagenet')(x)
+    else:
+        x = Conv2D(16, 3, strides=2, padding='same', use_bias=False)(inputs)
+        x = BatchNormalization()(x)
+        x = ReLU()(x)
+        for filters in (32, 64, 128):
+            x = SeparableConv2D(filters, 3, padding='same', use_bias=False)(x)
+            x = BatchNormalization()(x)
+            x = ReLU()(x)
+            x = MaxPooling2D()(x)
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.2)(x)
+    logits = Dense(len(class_labels), name='logits')(x)
+    outputs = Activation('softmax', name='probabilities')(logits)
+    return Model(inputs, outputs, name=f'student_{architecture}')
+
+
+def distillation_loss(temperature, alpha):
+    """Loss on student logits; ``y_true`` packs one-hot labels followed by teacher probabilities."""
+    n = len(class_labels)
+
+    def loss(y_true, logits):
+        hard, teacher_probs = y_true[:, :n], y_true[:, n:]
+        # The teacher only exposes softmax outputs, so re-soften them from their logs
+        teacher_soft = tf.nn.softmax(tf.math.log(teacher_probs + 1e-8) / temperature)
+        student_log_soft = tf.nn.log_softmax(logits / temperature)
+        kd = tf.reduce_sum(teacher_soft * (tf.math.log(teacher_soft + 1e-8) - student_log_soft), axis=-1)
+        ce = tf.nn.softmax_cross_entropy_with_logits(hard, logits)
+        return alpha * temperature ** 2 * kd + (1 - alpha) * ce
+
+    return loss
+
+
+# Data generator for batching, with targets labelled by the teacher on the fly
+def distillation_datagen(teacher, paths, labels, batch_size):
+    one_hot = np.eye(len(class_labels), dtype=np.float32)
+    indices = list(range(len(paths)))
+    rejected_paths = set()
+    while True:
+        random.shuffle(indices)
+        for i in range(0, len(indices) - batch_size + 1, batch_size):
+            batch = indices[i:i + batch_size]
+            images, rejected = load_images([paths[j] for j in batch], augment=True)
+            # Report each unreadable file once, not every epoch
+            report_rejected({path: reason for path, reason in rejected.items() if path not in rejected_paths})
+            rejected_paths.update(rejected)
+            batch = [j for j in batch if paths[j] not in rejected]
+            if not batch:
+                continue
+            teacher_probs = teacher(images, training=False).numpy()
+            yield images, np.concatenate([one_hot[labels[batch]], teacher_probs], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a lightweight student classifier from the VGG16 teacher.")
+    parser.add_argument('--train-dir', required=True, help="Training images, one sub-directory per class")
+    parser.add_argument('--test-dir', required=True, help="Test images, one sub-directory per class")
+    parser.add_argument('--teacher', default=MODEL_PATH)
+    parser.add_argument('--output', default=STUDENT_MODEL_PATH)
+    parser.add_argument('--architecture', choices=['small', 'mobilenet'], default='small')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.7, help="Weight of the distillation term vs. the hard-label loss")
+    parser.add_argument('--report', help="Write the teacher/student comparison to this JSON file")
+    args = parser.parse_args()
+
+    teacher = load_mri_model(args.teacher)
+    train_paths, train_labels = list_labeled_images(args.train_dir)
+
+    student = build_student(args.architecture)
+    trainer = Model(student.input, student.get_layer('logits').output)
+    trainer.compile(optimizer=Adam(learning_rate=args.learning_rate),
+                    loss=distillation_loss(args.temperature, args.alpha))
+    trainer.fit(
+        distillation_datagen(teacher, train_paths, train_labels, args.batch_size),
+        epochs=args.epochs, steps_per_epoch=len(train_paths) // args.batch_size
+    )
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    student.save(args.output)
+    print(f"Student model saved to {args.output}")
+
+    test_paths, test_labels = list_labeled_images(args.test_dir)
+    test_images, rejected = load_images(test_paths)
+    report_rejected(rejected)
+    test_labels = test_labels[[path not in rejected for path in test_paths]]
+    reports = {
+        'teacher': model_report(teacher, test_images, test_labels),
+        'student': model_report(student, test_images, test_labels),
+    }
+    print_comparison(reports)
+    speedup = reports['teacher']['latency_ms'] / reports['student']['latency_ms']
+    print(f"Student is {speedup:.1f}x faster per scan "
+          f"(accuracy {reports['student']['accuracy'] - reports['teacher']['accuracy']:+.2%} vs. teacher)")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
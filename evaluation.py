@@ -0,0 +1,51 @@
+import time
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from inference import class_labels, predict_batch
+
+
+def classification_metrics(labels, probabilities):
+    """Accuracy and one-vs-rest ROC AUC per class for predicted class probabilities."""
+    metrics = {'accuracy': float(np.mean(np.argmax(probabilities, axis=1) == labels))}
+    for i, label in enumerate(class_labels):
+        positives = labels == i
+        # AUC is undefined when a class is missing from the evaluation set
+        if positives.all() or not positives.any():
+            metrics[f'auc_{label}'] = float('nan')
+        else:
+            metrics[f'auc_{label}'] = float(roc_auc_score(positives, probabilities[:, i]))
+    return metrics
+
+
+def serving_latency_ms(model, img_array, runs=50, warmup=5):
+    """Median time in milliseconds for one ``predict_batch`` call on a single image, as the app scores a scan."""
+    timings = []
+    for i in range(warmup + runs):
+        start = time.perf_counter()
+        predict_batch(model, [img_array])
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def model_report(model, images, labels, batch_size=32):
+    """Accuracy, per-class AUC, parameter count and per-scan serving latency for one model."""
+    probabilities = model.predict(images, batch_size=batch_size, verbose=0)
+    report = classification_metrics(labels, probabilities)
+    report['parameters'] = int(model.count_params())
+    report['latency_ms'] = serving_latency_ms(model, images[0])
+    return report
+
+
+def print_comparison(reports):
+    """Print named model reports side by side, one metric per row."""
+    names = list(reports)
+    metrics = list(reports[names[0]])
+    print(f"{'metric':<18}" + ''.join(f"{name:>16}" for name in names))
+    for metric in metrics:
+        row = f"{metric:<18}"
+        for name in names:
+            value = reports[name][metric]
+            row += f"{value:>16,}" if isinstance(value, int) else f"{value:>16.4f}"
+        print(row)
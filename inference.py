@@ -0,0 +1,96 @@
+import hashlib
+import os
+import time
+from PIL import Image
+import numpy as np
+
+# Suppress TensorFlow oneDNN logs
+os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
+
+from tensorflow.keras.layers import Dense
+from tensorflow.keras.models import Model, load_model
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Set MRI_MODEL_PATH to serve another artifact with the same inputs/outputs (e.g. the distilled student)
+MODEL_PATH = os.environ.get('MRI_MODEL_PATH', os.path.join(BASE_DIR, 'models', 'mri_model.h5'))
+STUDENT_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'mri_student.h5')
+IMAGE_SIZE = 128
+class_labels = ['glioma', 'meningioma', 'notumor', 'pituitary']
+
+
+def load_mri_model(model_path=MODEL_PATH):
+    """Load the trained Keras model from disk (without Streamlit caching)."""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at: {model_path}")
+    return load_model(model_path, compile=False, safe_mode=False)
+
+
+def model_version(model_path=MODEL_PATH):
+    """Short identifier for a model artifact: file name plus a prefix of its SHA-256."""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return f"{os.path.basename(model_path)}@{digest.hexdigest()[:12]}"
+
+
+def embedding_model(model):
+    """Wrap a classifier so one forward pass returns (probabilities, embedding).
+
+    The embedding is the input to the final Dense layer, i.e. the 128-d
+    ``Dense(128, activation='relu')`` activations of the VGG16 model.
+    """
+    final_dense = [layer for layer in model.layers if isinstance(layer, Dense)][-1]
+    return Model(model.inputs, [model.outputs[0], final_dense.input])
+
+
+def preprocess_image(image):
+    """Convert a PIL image into a (128, 128, 3) float array scaled to [0, 1]."""
+    img = image.convert('RGB').resize((IMAGE_SIZE, IMAGE_SIZE))
+    return np.array(img) / 255.0
+
+
+def predict_batch(model, img_arrays):
+    """Run the model on a stack of preprocessed images and return class probabilities."""
+    batch = np.stack(img_arrays, axis=0)
+    return model.predict(batch, verbose=0)
+
+
+def describe_prediction(probabilities):
+    """Turn one probability vector into the result dict used by the app."""
+    predicted_class_index = int(np.argmax(probabilities))
+    return {
+        'result': class_labels[predicted_class_index],
+        'confidence': float(probabilities[predicted_class_index]),
+        'probabilities': {label: float(p) for label, p in zip(class_labels, probabilities)},
+    }
+
+
+def analyze_image(model, image, case_index=None, k=5, cascade=None):
+    """Classify a single PIL image and record how long inference took.
+
+    With a ``cascade``, its first-stage model answers confident scans and only
+    the rest reach ``model``; ``stage`` records which one decided. With a
+    ``case_index``, ``model`` must come from ``embedding_model`` and the ``k``
+    most similar indexed cases are added under ``similar_cases``. Only the full
+    model produces embeddings, so for scans the first stage decided
+    ``similar_cases`` is None to show that the search was skipped.
+    """
+    start = time.perf_counter()
+    img_array = preprocess_image(image)
+    probabilities = cascade.first_stage(img_array) if cascade is not None else None
+    if probabilities is not None:
+        prediction = describe_prediction(probabilities)
+        prediction['stage'] = 'fast'
+        if case_index is not None:
+            prediction['similar_cases'] = None
+    elif case_index is None:
+        prediction = describe_prediction(predict_batch(model, [img_array])[0])
+        prediction['stage'] = 'full'
+    else:
+        probabilities, embeddings = predict_batch(model, [img_array])
+        prediction = describe_prediction(probabilities[0])
+        prediction['stage'] = 'full'
+        prediction['similar_cases'] = case_index.search(embeddings[0], k)
+    prediction['inference_ms'] = (time.perf_counter() - start) * 1000
+    return prediction
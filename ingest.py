@@ -0,0 +1,87 @@
+import io
+import os
+import warnings
+from PIL import Image
+
+from inference import IMAGE_SIZE
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # Keep in sync with server.maxUploadSize in .streamlit/config.toml
+MAX_IMAGE_PIXELS = 25_000_000  # ~5000x5000; MRI slices are far smaller
+ALLOWED_FORMATS = ('JPEG', 'PNG')
+
+
+class UploadRejected(ValueError):
+    """Raised when an uploaded file is not an image we are willing to decode."""
+
+
+def _as_file(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def _byte_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    size = getattr(source, 'size', None)
+    if size is None:
+        # Plain open files and other streams: measure by seeking to the end
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+    return size
+
+
+def open_upload(source):
+    """Open an upload lazily and check its size, format and dimensions from the header alone.
+
+    ``source`` may be raw bytes or a file-like object such as Streamlit's
+    ``UploadedFile``. Pixel data is not decoded here. Raises ``UploadRejected``
+    with a message suitable for showing to the user.
+    """
+    size = _byte_size(source)
+    if size > MAX_UPLOAD_BYTES:
+        raise UploadRejected(
+            f"File is {size / 1024 ** 2:.1f} MB; the maximum upload size is {MAX_UPLOAD_BYTES // 1024 ** 2} MB."
+        )
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(_as_file(source))
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        raise UploadRejected("Image dimensions are too large to process safely.")
+    except OSError:
+        raise UploadRejected("The file could not be read as an image. Please upload a JPG or PNG MRI scan.")
+    if image.format not in ALLOWED_FORMATS:
+        raise UploadRejected(f"{image.format} images are not supported. Please upload a JPG or PNG MRI scan.")
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected(
+            f"Image is {width}x{height} pixels; images larger than "
+            f"{MAX_IMAGE_PIXELS // 1_000_000} megapixels are not accepted."
+        )
+    return image
+
+
+def load_upload(source, size=IMAGE_SIZE):
+    """Validate an upload and decode it straight down to roughly ``size`` pixels per side.
+
+    JPEGs use draft mode so the decoder itself downscales by up to 8x. PNGs
+    have no such mode: they are decoded at full resolution and only then
+    box-reduced, so their memory and CPU cost is bounded by
+    ``MAX_IMAGE_PIXELS`` alone. The result is an RGB image no smaller than
+    ``size`` on its short side, ready for the final resize in preprocessing.
+    """
+    image = open_upload(source)
+    if image.format == 'JPEG':
+        image.draft('RGB', (size, size))
+    try:
+        image = image.convert('RGB')
+    except OSError:
+        raise UploadRejected("The image file is truncated or corrupted.")
+    # Shrink with a cheap box reduction first, keeping the aspect ratio and at least `size` pixels per side
+    factor = min(image.size) // size
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
@@ -0,0 +1,331 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from inference import analyze_image, embedding_model, load_mri_model
+from ingest import load_upload
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, 'data', 'jobs.sqlite3')
+DEFAULT_NUM_WORKERS = 2
+DEFAULT_MAX_PENDING = 20
+# Finished jobs and their results are deleted after this many days; 0 keeps them forever
+DEFAULT_RETENTION_DAYS = 30
+# How often the heartbeat thread deletes expired jobs
+PRUNE_INTERVAL = 3600.0
+# How often idle workers check the database for jobs submitted by other processes
+IDLE_POLL_INTERVAL = 0.2
+# First interval at which wait() re-checks a job; it backs off from here to its poll_interval
+FIRST_POLL_INTERVAL = 0.02
+# A running job whose owner has not renewed its lease for this long is re-queued by any queue
+LEASE_SECONDS = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at);
+"""
+
+# Queues in one process that share a database share one wakeup event, so a job
+# submitted through any of them is picked up at once rather than on the idle poll
+_wakeups = {}
+_wakeups_lock = threading.Lock()
+
+
+def _shared_wakeup(db_path):
+    with _wakeups_lock:
+        return _wakeups.setdefault(os.path.abspath(db_path), threading.Event())
+
+
+class QueueFullError(Exception):
+    """Raised when a submission would exceed the pending-job limit."""
+
+
+class JobQueue:
+    """SQLite-backed job queue and result store served by a fixed pool of worker threads.
+
+    Jobs and their per-image results are persisted in ``db_path`` so they survive
+    restarts. A running job is leased to the queue that claimed it and the lease
+    is renewed by a heartbeat thread; once a lease expires (its process died),
+    any queue sharing the database picks the job up again and resumes from the
+    first unfinished image. Finished jobs are deleted ``retention_days`` after
+    they finish.
+    """
+
+    def __init__(self, db_path=None, num_workers=None, max_pending=None, model_loader=load_mri_model,
+                 case_index=None, cascade=None, lease_seconds=LEASE_SECONDS, retention_days=None):
+        # Unset options fall back to the MRI_* environment variables, then the defaults
+        self.db_path = db_path or os.environ.get('MRI_JOBS_DB', DEFAULT_DB_PATH)
+        if num_workers is None:
+            num_workers = int(os.environ.get('MRI_JOB_WORKERS', DEFAULT_NUM_WORKERS))
+        if max_pending is None:
+            max_pending = int(os.environ.get('MRI_MAX_PENDING_JOBS', DEFAULT_MAX_PENDING))
+        if retention_days is None:
+            retention_days = float(os.environ.get('MRI_JOB_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        self.model_loader = model_loader
+        self.case_index = case_index
+        self.cascade = cascade
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._wakeup = _shared_wakeup(self.db_path)
+        self._stopping = threading.Event()
+        self._workers = []
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Databases created before job leases lack the lease columns
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (('owner', 'TEXT'), ('lease_expires', 'REAL')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation; commits on success, rolls back on error
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = self.model_loader()
+                if self.case_index is not None:
+                    self._model = embedding_model(self._model)
+            return self._model
+
+    def start(self):
+        """Start the worker threads and the lease heartbeat."""
+        if self._workers:
+            return self
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='mri-job-heartbeat', daemon=True)
+        heartbeat.start()
+        self._workers.append(heartbeat)
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'mri-job-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def stop(self, timeout=None):
+        """Ask the workers to exit after their current image and wait for them."""
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def prune(self):
+        """Delete finished jobs older than ``retention_days`` with their results; returns how many."""
+        if not self.retention_days:
+            return 0
+        cutoff = time.time() - self.retention_days * 86400
+        expired = "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?"
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM job_items WHERE job_id IN ({expired})", (cutoff,))
+            return conn.execute(f"DELETE FROM jobs WHERE id IN ({expired})", (cutoff,)).rowcount
+
+    def pending_count(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()
+        return row[0]
+
+    def submit(self, items):
+        """Queue a scan or study for analysis and return its job ID immediately.
+
+        ``items`` is a list of ``(name, image_bytes)`` pairs. Raises
+        ``QueueFullError`` when ``max_pending`` jobs are already waiting.
+        """
+        if not items:
+            raise ValueError("A job needs at least one image")
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFullError(
+                    f"The analysis queue is full ({pending} jobs pending). Please try again shortly."
+                )
+            conn.execute(
+                "INSERT INTO jobs (id, status, total, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, len(items), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, name, data) VALUES (?, ?, ?, ?)",
+                [(job_id, idx, name, sqlite3.Binary(data)) for idx, (name, data) in enumerate(items)]
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get_job(self, job_id):
+        """Return the job's status and progress, plus its results once finished, or None."""
+        with self._connect() as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            job = dict(job)
+            if job['status'] in ('queued', 'running'):
+                job['position'] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                    (job['created_at'],)
+                ).fetchone()[0]
+            rows = conn.execute(
+                "SELECT idx, name, result, error FROM job_items WHERE job_id = ? ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+        job['items'] = [
+            {
+                'name': row['name'],
+                'result': json.loads(row['result']) if row['result'] else None,
+                'error': row['error'],
+            }
+            for row in rows
+        ]
+        return job
+
+    def wait(self, job_id, poll_interval=0.5, timeout=None):
+        """Yield job snapshots until the job finishes; the last one holds the results.
+
+        Polling starts at ``FIRST_POLL_INTERVAL`` and doubles up to
+        ``poll_interval``, so a quick single-scan job is not held back by a
+        full polling interval.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = min(FIRST_POLL_INTERVAL, poll_interval)
+        while True:
+            job = self.get_job(job_id)
+            yield job
+            if job is None or job['status'] in ('done', 'failed'):
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, poll_interval)
+
+    def _claim_next_job(self):
+        """Lease the oldest queued job, or a running one whose owner stopped renewing its lease."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_expires = ?, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (self.owner, now + self.lease_seconds, now, row['id'])
+            )
+            return row['id']
+
+    def _heartbeat_loop(self):
+        last_prune = None
+        # Renew leases often enough that a slow image or model load never lets one lapse
+        while True:
+            if last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                self.prune()
+                last_prune = time.monotonic()
+            if self._stopping.wait(self.lease_seconds / 3):
+                return
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status = 'running'",
+                    (time.time() + self.lease_seconds, self.owner)
+                )
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            job_id = self._claim_next_job()
+            if job_id is None:
+                self._wakeup.wait(timeout=IDLE_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run_job(job_id)
+            except Exception as e:
+                with self._connect() as conn:
+                    failed = conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND owner = ?",
+                        (str(e), time.time(), job_id, self.owner)
+                    ).rowcount
+                    # A failed job is never retried, so its scans are not kept either
+                    if failed == 1:
+                        conn.execute("UPDATE job_items SET data = NULL WHERE job_id = ?", (job_id,))
+
+    def _run_job(self, job_id):
+        model = self._get_model()
+        with self._connect() as conn:
+            pending = conn.execute(
+                "SELECT idx, data FROM job_items WHERE job_id = ? AND result IS NULL AND error IS NULL ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+
+        for row in pending:
+            if self._stopping.is_set():
+                return
+            result, error = None, None
+            try:
+                image = load_upload(row['data'])
+                result = json.dumps(analyze_image(model, image, case_index=self.case_index, cascade=self.cascade))
+            except Exception as e:
+                error = f"Error processing the image: {e}"
+            # Drop the image bytes once scored; only the result needs to be kept. The
+            # guard makes sure an image finished by another queue is never counted twice.
+            with self._connect() as conn:
+                updated = conn.execute(
+                    "UPDATE job_items SET result = ?, error = ?, data = NULL "
+                    "WHERE job_id = ? AND idx = ? AND result IS NULL AND error IS NULL",
+                    (result, error, job_id, row['idx'])
+                ).rowcount
+                if updated == 1:
+                    conn.execute("UPDATE jobs SET completed = completed + 1 WHERE id = ?", (job_id,))
+
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ? AND owner = ?",
+                (time.time(), job_id, self.owner)
+            )
@@ -0,0 +1,234 @@
+"""Load-testing harness that simulates concurrent clinicians against the MRI app.
+
+Each simulated session submits a synthetic MRI-like image and waits for the
+analysis, either by running the real Streamlit detection page through AppTest
+(``--mode apptest``) or by driving the background job queue directly
+(``--mode queue``). AppTest cannot drive the file uploader, so in apptest mode
+the scan is submitted to the app's queue directly: the page's upload
+validation and preview are not exercised, while the ``ingest`` checks still run
+when the queue's workers decode the scan. Everything runs in-process on the
+local machine, so the reported RSS is the memory of the app "server" under
+that load.
+
+Example:
+    python loadtest.py --concurrency 1,2,4,8 --requests 5 --output results.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from PIL import Image
+import numpy as np
+
+from inference import MODEL_PATH, load_mri_model
+from jobs import JobQueue
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(BASE_DIR, 'app.py')
+DETECTION_PAGE = "🔬 Disease Detection"
+
+
+def synthetic_mri(rng, size=512):
+    """Render a grayscale axial-slice-like image: skull ring, brain texture and an optional lesion."""
+    yy, xx = np.mgrid[0:size, 0:size] / size - 0.5
+    ry, rx = rng.uniform(0.36, 0.44, size=2)
+    r = np.sqrt((xx / rx) ** 2 + (yy / ry) ** 2)
+
+    img = np.zeros((size, size))
+    img[r < 1.0] = 0.85  # skull
+    brain = r < 0.9
+    img[brain] = 0.35 + 0.1 * np.sin(20 * xx[brain] + rng.uniform(0, 6)) * np.cos(18 * yy[brain])
+    if rng.random() < 0.75:
+        cy, cx = rng.uniform(-0.2, 0.2, size=2)
+        radius = rng.uniform(0.03, 0.1)
+        lesion = (xx - cx) ** 2 + (yy - cy) ** 2 < radius ** 2
+        img[lesion] = rng.uniform(0.6, 0.95)
+    img += rng.normal(0, 0.04, img.shape)
+
+    pixels = (np.clip(img, 0, 1) * 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels, mode='L').convert('RGB').save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB.
+
+    Uses psutil when installed, then /proc on Linux; elsewhere falls back to
+    the peak RSS, or NaN where neither is available (Windows without psutil).
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux and the BSDs
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_queue_request(job_queue, image_bytes, timeout):
+    """Submit one scan straight to the job queue and wait for its result."""
+    job_id = job_queue.submit([('synthetic.jpg', image_bytes)])
+    for job in job_queue.wait(job_id, poll_interval=0.05, timeout=timeout):
+        pass
+    if job is None or job['status'] != 'done':
+        raise RuntimeError(f"job {job_id} ended as {job and job['status']}")
+    if job['items'][0]['error']:
+        raise RuntimeError(job['items'][0]['error'])
+
+
+def run_apptest_request(job_queue, image_bytes, timeout):
+    """Run the Streamlit detection page for one scan, as a clinician's browser session would.
+
+    AppTest cannot drive ``st.file_uploader``, so the scan is submitted the way
+    the Analyze button does it and the job ID is handed to the session, which
+    opens straight on the detection page. The harness queue shares the app
+    queue's database and wakeup event, so the app's workers start on the job
+    immediately, as they would after a real Analyze click. The page's upload
+    validation and preview are skipped; ``ingest`` still runs in the workers.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state['app_mode'] = DETECTION_PAGE
+    at.session_state['job_id'] = job_queue.submit([('synthetic.jpg', image_bytes)])
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    if at.error:
+        raise RuntimeError(at.error[0].value)
+    if not any('Analysis Confidence' in md.value for md in at.markdown):
+        raise RuntimeError("analysis results were not rendered")
+
+
+def run_level(request_fn, job_queue, concurrency, requests_per_session, timeout, seed):
+    """Run ``concurrency`` sessions in parallel and summarise latency, throughput and errors."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def session(session_id):
+        rng = np.random.default_rng(seed + session_id)
+        for _ in range(requests_per_session):
+            image_bytes = synthetic_mri(rng)
+            start = time.perf_counter()
+            try:
+                request_fn(job_queue, image_bytes, timeout)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+            else:
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = len(latencies) + len(errors)
+    p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99]) if latencies else [float('nan')] * 4
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_s': p50,
+        'p90_s': p90,
+        'p95_s': p95,
+        'p99_s': p99,
+        'error_rate': len(errors) / total if total else 0.0,
+        'rss_mb': current_rss_mb(),
+        'sample_error': errors[0] if errors else '',
+    }
+
+
+def write_results(rows, path):
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent clinicians against the MRI analysis path.")
+    parser.add_argument('--mode', choices=['apptest', 'queue'], default='apptest',
+                        help="apptest: full Streamlit script runs; queue: background job queue only")
+    parser.add_argument('--concurrency', default='1,2,4,8',
+                        help="Comma-separated concurrency levels to sweep")
+    parser.add_argument('--requests', type=int, default=5, help="Analyses per simulated session and level")
+    parser.add_argument('--workers', type=int, default=2, help="Job queue worker threads")
+    parser.add_argument('--model', default=MODEL_PATH, help="Model file to serve (queue mode)")
+    parser.add_argument('--timeout', type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write per-level results to a .csv or .json file")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    # Isolate the run from the real result store
+    db_path = os.path.join(tempfile.mkdtemp(prefix='mri-loadtest-'), 'jobs.sqlite3')
+
+    if args.mode == 'queue':
+        max_pending = max(levels) + 1
+        job_queue = JobQueue(db_path=db_path, num_workers=args.workers, max_pending=max_pending,
+                             model_loader=lambda: load_mri_model(args.model)).start()
+        request_fn = run_queue_request
+    else:
+        # The app's own workers pick up these jobs from the shared database and wakeup event
+        os.environ['MRI_JOBS_DB'] = db_path
+        os.environ['MRI_JOB_WORKERS'] = str(args.workers)
+        job_queue = JobQueue(db_path=db_path, num_workers=0, max_pending=max(levels) + 1)
+        request_fn = run_apptest_request
+
+    # Warm up so model loading is not counted against the first level
+    request_fn(job_queue, synthetic_mri(np.random.default_rng(args.seed)), args.timeout)
+    if args.mode == 'apptest':
+        # AppTest sessions driven from plain threads log a harmless "missing ScriptRunContext" warning
+        from streamlit import logger as st_logger
+        st_logger.set_log_level('error')
+
+    rows = []
+    if args.mode == 'apptest':
+        print("Note: apptest mode cannot drive st.file_uploader, so the page's upload validation and preview "
+              "are not timed; scans are submitted to the queue directly and decoded by its workers")
+    print(f"{'users':>5} {'reqs':>5} {'req/s':>7} {'p50 s':>7} {'p90 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>7} {'RSS MB':>8}")
+    for concurrency in levels:
+        row = run_level(request_fn, job_queue, concurrency, args.requests, args.timeout, args.seed)
+        rows.append(row)
+        print(f"{row['concurrency']:>5} {row['requests']:>5} {row['throughput_rps']:>7.2f} "
+              f"{row['p50_s']:>7.2f} {row['p90_s']:>7.2f} {row['p95_s']:>7.2f} {row['p99_s']:>7.2f} "
+              f"{row['error_rate']:>7.1%} {row['rss_mb']:>8.0f}")
+        if row['sample_error']:
+            print(f"      first error: {row['sample_error']}")
+
+    if args.mode == 'queue':
+        job_queue.stop()
+    if args.output:
+        write_results(rows, args.output)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
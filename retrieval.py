@@ -0,0 +1,178 @@
+"""Similar-case retrieval over the model's penultimate-layer embeddings.
+
+Each reference scan is represented by the activations feeding the model's
+final Dense layer (the 128-d ``Dense(128, activation='relu')`` output for the
+VGG16 model), L2-normalised and stored as a flat float16/float32 matrix that
+is memory-mapped at load. Cosine similarity against that matrix returns the
+top-k prior cases for a new scan.
+
+The index is append-only: rebuilding with new archive images only embeds
+files that are not indexed yet.
+
+Example:
+    python retrieval.py --archive-dir "MRI Images/Training"
+"""
+import argparse
+import json
+import os
+import numpy as np
+
+from dataset import list_labeled_images, load_images, report_rejected
+from inference import BASE_DIR, MODEL_PATH, class_labels, embedding_model, load_mri_model, model_version
+
+DEFAULT_INDEX_DIR = os.environ.get('MRI_CASE_INDEX_DIR', os.path.join(BASE_DIR, 'models', 'case_index'))
+EMBEDDINGS_FILE = 'embeddings.bin'
+CASES_FILE = 'cases.jsonl'
+INFO_FILE = 'index.json'
+SEARCH_CHUNK_ROWS = 65536
+
+
+class CaseIndex:
+    """Append-only on-disk index of case embeddings and their labels."""
+
+    def __init__(self, index_dir, info, cases):
+        self.index_dir = index_dir
+        self.info = info
+        self.cases = cases
+        self._map()
+
+    @classmethod
+    def create(cls, index_dir, dim, model_version, dtype='float16'):
+        os.makedirs(index_dir, exist_ok=True)
+        info = {'dim': int(dim), 'dtype': dtype, 'count': 0, 'cases_bytes': 0, 'model_version': model_version}
+        open(os.path.join(index_dir, EMBEDDINGS_FILE), 'wb').close()
+        open(os.path.join(index_dir, CASES_FILE), 'w').close()
+        _write_json(os.path.join(index_dir, INFO_FILE), info)
+        return cls(index_dir, info, [])
+
+    @classmethod
+    def load(cls, index_dir=DEFAULT_INDEX_DIR):
+        with open(os.path.join(index_dir, INFO_FILE)) as f:
+            info = json.load(f)
+        # index.json is written last on append, so its counts mark the committed rows
+        with open(os.path.join(index_dir, CASES_FILE), 'rb') as f:
+            records = f.read(info['cases_bytes'])
+        cases = [json.loads(line) for line in records.decode('utf-8').splitlines()]
+        return cls(index_dir, info, cases)
+
+    @property
+    def model_version(self):
+        return self.info['model_version']
+
+    def __len__(self):
+        return self.info['count']
+
+    def _map(self):
+        count, dim = self.info['count'], self.info['dim']
+        if count == 0:
+            self.embeddings = np.empty((0, dim), dtype=self.info['dtype'])
+        else:
+            self.embeddings = np.memmap(os.path.join(self.index_dir, EMBEDDINGS_FILE),
+                                        dtype=self.info['dtype'], mode='r', shape=(count, dim))
+
+    def indexed_paths(self):
+        return {case['path'] for case in self.cases}
+
+    def append(self, embeddings, cases):
+        """Add a batch of embeddings with matching ``{'path', 'label'}`` case records."""
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32)).astype(self.info['dtype'])
+        cases = list(cases)
+        count = self.info['count']
+        records = ''.join(json.dumps(case) + '\n' for case in cases).encode('utf-8')
+        # Drop anything left by an interrupted append before writing past the committed end
+        with open(os.path.join(self.index_dir, EMBEDDINGS_FILE), 'r+b') as f:
+            f.truncate(count * self.info['dim'] * embeddings.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(embeddings.tobytes())
+        with open(os.path.join(self.index_dir, CASES_FILE), 'r+b') as f:
+            f.truncate(self.info['cases_bytes'])
+            f.seek(0, os.SEEK_END)
+            f.write(records)
+        self.cases.extend(cases)
+        self.info['count'] = count + len(embeddings)
+        self.info['cases_bytes'] += len(records)
+        _write_json(os.path.join(self.index_dir, INFO_FILE), self.info)
+        self._map()
+
+    def search(self, query, k=5):
+        """Return the ``k`` most similar cases to one query embedding, most similar first."""
+        if len(self) == 0:
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32)[None, :])[0]
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_CHUNK_ROWS):
+            chunk = np.asarray(self.embeddings[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.cases[i], similarity=float(scores[i])) for i in top]
+
+
+def open_case_index(index_dir=DEFAULT_INDEX_DIR, model_path=MODEL_PATH):
+    """Load the index for serving, or return None if none has been built.
+
+    Raises ``ValueError`` if the index was built from a different model, since
+    its embeddings would not be comparable.
+    """
+    if not os.path.exists(os.path.join(index_dir, INFO_FILE)):
+        return None
+    index = CaseIndex.load(index_dir)
+    version = model_version(model_path)
+    if index.model_version != version:
+        raise ValueError(f"{index_dir} was built with {index.model_version}, not {version}")
+    return index
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or extend the similar-case embedding index.")
+    parser.add_argument('--archive-dir', required=True, help="Reference images, one sub-directory per class")
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--dtype', choices=['float16', 'float32'], default='float16')
+    args = parser.parse_args()
+
+    embedder = embedding_model(load_mri_model(args.model))
+    try:
+        index = open_case_index(args.index_dir, args.model)
+    except ValueError as e:
+        parser.error(f"{e}; use a new --index-dir for this model")
+    if index is None:
+        index = CaseIndex.create(args.index_dir, embedder.outputs[1].shape[-1], model_version(args.model), args.dtype)
+
+    paths, labels = list_labeled_images(args.archive_dir)
+    indexed = index.indexed_paths()
+    todo = [(os.path.abspath(p), l) for p, l in zip(paths, labels) if os.path.abspath(p) not in indexed]
+    print(f"{len(index)} cases already indexed, {len(todo)} new")
+
+    skipped = 0
+    for start in range(0, len(todo), args.batch_size):
+        batch = todo[start:start + args.batch_size]
+        images, rejected = load_images([p for p, _ in batch])
+        # Files the upload guard rejects are left out, and retried on the next build, rather than
+        # failing the batch and blocking the index from growing
+        report_rejected(rejected)
+        skipped += len(rejected)
+        batch = [(p, l) for p, l in batch if p not in rejected]
+        if batch:
+            _, embeddings = embedder.predict(images, verbose=0)
+            index.append(embeddings, [{'path': p, 'label': class_labels[l]} for p, l in batch])
+        print(f"Indexed {len(index)} cases", end='\r')
+    print(f"\nIndex at {args.index_dir} holds {len(index)} cases; skipped {skipped} unreadable files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import csv
+import glob
+import io
+import os
+import sys
+from PIL import Image
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_score
+from bulk_score import COMMIT_MARKER, MANIFEST_FILE, read_manifest
+
+
+class CountingModel:
+    """Stand-in for the Keras model that records how many images it scored."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, batch, verbose=0):
+        self.calls += len(batch)
+        return np.tile([0.1, 0.1, 0.7, 0.1], (len(batch), 1))
+
+
+def write_scan(path):
+    buf = io.BytesIO()
+    Image.new('RGB', (160, 160), (90, 90, 90)).save(buf, format='JPEG')
+    with open(path, 'wb') as f:
+        f.write(buf.getvalue())
+
+
+@pytest.fixture
+def archive(tmp_path):
+    input_dir = tmp_path / 'slices'
+    input_dir.mkdir()
+    for i in range(5):
+        write_scan(input_dir / f'{i}.jpg')
+    model_path = tmp_path / 'model.h5'
+    model_path.write_bytes(b'model weights')
+    return input_dir, tmp_path / 'scores', model_path
+
+
+def run(monkeypatch, archive, *extra):
+    input_dir, output_dir, model_path = archive
+    model = CountingModel()
+    monkeypatch.setattr(bulk_score, 'load_mri_model', lambda path: model)
+    monkeypatch.setattr(sys, 'argv', ['bulk_score.py', str(input_dir), '--output-dir', str(output_dir),
+                                      '--model', str(model_path), '--batch-size', '2', '--part-size', '2',
+                                      '--workers', '2', *extra])
+    bulk_score.main()
+    return model
+
+
+def scored_rows(output_dir):
+    rows = []
+    for part in sorted(glob.glob(os.path.join(output_dir, 'part-*.csv'))):
+        with open(part, newline='') as f:
+            rows.extend(csv.DictReader(f))
+    return rows
+
+
+def test_resume_ignores_uncommitted_tail_and_parts(monkeypatch, archive):
+    input_dir, output_dir, _ = archive
+    assert run(monkeypatch, archive).calls == 5
+
+    # Simulate a crash while the next part was being committed: an orphaned
+    # part file and a manifest block without its commit line, cut off mid-line
+    manifest_path = output_dir / MANIFEST_FILE
+    committed = manifest_path.read_bytes()
+    (output_dir / 'part-00003.csv').write_text('partial')
+    with open(manifest_path, 'ab') as f:
+        f.write(f"part-00003.csv\tok\t{input_dir / '5.jpg'}\npart-00003.csv\tok\t{input_dir}".encode())
+    write_scan(input_dir / '5.jpg')
+
+    model = run(monkeypatch, archive)
+
+    assert model.calls == 1
+    assert manifest_path.read_bytes().startswith(committed)
+    assert manifest_path.read_bytes().endswith(f"{COMMIT_MARKER}\tpart-00003.csv\n".encode())
+    paths = [row['path'] for row in scored_rows(output_dir)]
+    assert sorted(paths) == sorted(str(input_dir / f'{i}.jpg') for i in range(6))
+
+
+def test_resume_with_other_model_or_format_is_refused(monkeypatch, archive):
+    _, output_dir, model_path = archive
+    run(monkeypatch, archive)
+
+    with pytest.raises(SystemExit):
+        run(monkeypatch, archive, '--format', 'parquet')
+    model_path.write_bytes(b'retrained weights')
+    with pytest.raises(SystemExit):
+        run(monkeypatch, archive)
+    assert len(scored_rows(output_dir)) == 5
+
+
+def test_errored_image_is_retried_only_on_request(monkeypatch, archive):
+    input_dir, output_dir, _ = archive
+    (input_dir / 'bad.jpg').write_bytes(b'not an image')
+
+    assert run(monkeypatch, archive).calls == 5
+    _, done, failed, _ = read_manifest(str(output_dir))
+    assert failed == {str(input_dir / 'bad.jpg')}
+    assert len(done) == 6
+
+    # A plain rerun leaves the error row alone
+    assert run(monkeypatch, archive).calls == 0
+
+    write_scan(input_dir / 'bad.jpg')
+    assert run(monkeypatch, archive, '--retry-errors').calls == 1
+    _, done, failed, _ = read_manifest(str(output_dir))
+    assert failed == set()
+    assert len(done) == 6
+    retried = [row for row in scored_rows(output_dir) if row['path'] == str(input_dir / 'bad.jpg')]
+    assert [bool(row['error']) for row in retried] == [True, False]
@@ -0,0 +1,67 @@
+import io
+import os
+import struct
+import sys
+import zlib
+from PIL import Image
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import MAX_UPLOAD_BYTES, UploadRejected, load_upload, open_upload
+
+
+def encode(image, fmt):
+    buf = io.BytesIO()
+    image.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def png_header(width, height):
+    """A PNG whose header claims the given size; only the header is ever read."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IEND', b'')
+
+
+def test_large_jpeg_is_decoded_down_to_model_size():
+    image = load_upload(encode(Image.new('RGB', (1024, 768), (90, 90, 90)), 'JPEG'))
+    assert image.mode == 'RGB'
+    assert min(image.size) >= 128
+    assert max(image.size) < 512
+
+
+def test_plain_open_file_is_accepted(tmp_path):
+    path = tmp_path / 'scan.png'
+    path.write_bytes(encode(Image.new('L', (300, 300), 120), 'PNG'))
+    with open(path, 'rb') as f:
+        assert load_upload(f).size == (150, 150)
+
+
+def test_oversized_upload_is_rejected_before_decoding():
+    with pytest.raises(UploadRejected, match='maximum upload size'):
+        open_upload(b'\xff\xd8' + b'\0' * MAX_UPLOAD_BYTES)
+
+
+def test_image_over_pixel_limit_is_rejected():
+    with pytest.raises(UploadRejected, match='megapixels'):
+        open_upload(png_header(6000, 6000))
+
+
+def test_decompression_bomb_is_rejected():
+    with pytest.raises(UploadRejected, match='too large'):
+        open_upload(png_header(40000, 40000))
+
+
+def test_truncated_image_is_rejected():
+    data = encode(Image.effect_noise((256, 256), 64).convert('RGB'), 'JPEG')
+    with pytest.raises(UploadRejected, match='truncated'):
+        load_upload(data[:len(data) // 2])
+
+
+def test_unsupported_format_and_non_image_are_rejected():
+    with pytest.raises(UploadRejected, match='GIF images are not supported'):
+        open_upload(encode(Image.new('P', (64, 64)), 'GIF'))
+    with pytest.raises(UploadRejected, match='could not be read'):
+        open_upload(b'%PDF-1.4 not an image')
@@ -0,0 +1,117 @@
+import io
+import os
+import sys
+import threading
+import time
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import JobQueue
+
+
+class CountingModel:
+    """Stand-in for the Keras model that records how many images it scored."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def predict(self, batch, verbose=0):
+        with self.lock:
+            self.calls += len(batch)
+        time.sleep(self.delay)
+        return np.tile([0.1, 0.1, 0.7, 0.1], (len(batch), 1))
+
+
+def scan_bytes():
+    buf = io.BytesIO()
+    Image.new('RGB', (200, 200), (90, 90, 90)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def wait_until_finished(job_queue, job_id, timeout=20):
+    for job in job_queue.wait(job_id, poll_interval=0.05, timeout=timeout):
+        pass
+    return job
+
+
+def test_job_of_crashed_queue_is_resumed_after_lease_expires(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    crashed = JobQueue(db_path=db_path, num_workers=1, lease_seconds=0.5, model_loader=CountingModel)
+    job_id = crashed.submit([(f'scan{i}.png', scan_bytes()) for i in range(3)])
+    # Claim the job without ever running or renewing it, as if the process died right after
+    assert crashed._claim_next_job() == job_id
+
+    model = CountingModel()
+    restarted = JobQueue(db_path=db_path, num_workers=1, lease_seconds=0.5, model_loader=lambda: model).start()
+    try:
+        job = wait_until_finished(restarted, job_id)
+    finally:
+        restarted.stop()
+
+    assert job['status'] == 'done'
+    assert job['completed'] == job['total'] == 3
+    assert all(item['result']['result'] == 'notumor' for item in job['items'])
+    assert model.calls == 3
+
+
+def test_second_queue_does_not_take_over_a_live_job(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    first_model, second_model = CountingModel(delay=0.2), CountingModel(delay=0.2)
+    first = JobQueue(db_path=db_path, num_workers=1, lease_seconds=0.6, model_loader=lambda: first_model).start()
+    job_id = first.submit([(f'scan{i}.png', scan_bytes()) for i in range(4)])
+    while first.get_job(job_id)['status'] != 'running':
+        time.sleep(0.01)
+
+    second = JobQueue(db_path=db_path, num_workers=1, lease_seconds=0.6, model_loader=lambda: second_model).start()
+    try:
+        job = wait_until_finished(first, job_id)
+    finally:
+        first.stop()
+        second.stop()
+
+    assert job['status'] == 'done'
+    assert job['completed'] == job['total'] == 4
+    assert first_model.calls == 4
+    assert second_model.calls == 0
+
+
+def test_failed_job_drops_its_scans(tmp_path):
+    def broken_loader():
+        raise RuntimeError("model file is corrupt")
+
+    job_queue = JobQueue(db_path=str(tmp_path / 'jobs.sqlite3'), num_workers=1, model_loader=broken_loader).start()
+    try:
+        job_id = job_queue.submit([('scan.png', scan_bytes())])
+        job = wait_until_finished(job_queue, job_id)
+    finally:
+        job_queue.stop()
+
+    assert job['status'] == 'failed'
+    assert 'model file is corrupt' in job['error']
+    with job_queue._connect() as conn:
+        assert conn.execute("SELECT data FROM job_items WHERE job_id = ?", (job_id,)).fetchone()['data'] is None
+
+
+def test_prune_deletes_only_expired_finished_jobs(tmp_path):
+    job_queue = JobQueue(db_path=str(tmp_path / 'jobs.sqlite3'), num_workers=1, retention_days=7,
+                         model_loader=CountingModel).start()
+    try:
+        old_id, recent_id = (job_queue.submit([('scan.png', scan_bytes())]) for _ in range(2))
+        for job_id in (old_id, recent_id):
+            wait_until_finished(job_queue, job_id)
+    finally:
+        job_queue.stop()
+    queued_id = job_queue.submit([('scan.png', scan_bytes())])
+    with job_queue._connect() as conn:
+        conn.execute("UPDATE jobs SET finished_at = ? WHERE id = ?", (time.time() - 8 * 86400, old_id))
+
+    assert job_queue.prune() == 1
+    assert job_queue.get_job(old_id) is None
+    assert job_queue.get_job(recent_id)['status'] == 'done'
+    assert job_queue.get_job(queued_id)['status'] == 'queued'
+    with job_queue._connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM job_items WHERE job_id = ?", (old_id,)).fetchone()[0] == 0
@@ -0,0 +1,44 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import CASES_FILE, EMBEDDINGS_FILE, CaseIndex
+
+
+def test_append_after_interrupted_append_keeps_only_committed_rows(tmp_path):
+    index_dir = str(tmp_path / 'case_index')
+    index = CaseIndex.create(index_dir, dim=4, model_version='mri_model.h5@abc', dtype='float32')
+    index.append(np.eye(4)[:2], [{'path': 'a.jpg', 'label': 'glioma'}, {'path': 'b.jpg', 'label': 'notumor'}])
+
+    # A crash after writing rows but before index.json was updated leaves uncommitted data behind
+    with open(os.path.join(index_dir, EMBEDDINGS_FILE), 'ab') as f:
+        f.write(np.ones((3, 4), dtype=np.float32).tobytes())
+    with open(os.path.join(index_dir, CASES_FILE), 'a') as f:
+        f.write('{"path": "lost.jpg", "label": "glioma"}\n{"path": "cut')
+
+    reloaded = CaseIndex.load(index_dir)
+    assert len(reloaded) == 2
+    assert reloaded.indexed_paths() == {'a.jpg', 'b.jpg'}
+
+    reloaded.append(np.eye(4)[2:3] * 5, [{'path': 'c.jpg', 'label': 'pituitary'}])
+    final = CaseIndex.load(index_dir)
+    assert len(final) == 3
+    assert [case['path'] for case in final.cases] == ['a.jpg', 'b.jpg', 'c.jpg']
+    assert os.path.getsize(os.path.join(index_dir, EMBEDDINGS_FILE)) == 3 * 4 * 4
+    np.testing.assert_allclose(final.embeddings, np.eye(4)[:3])
+
+    assert [case['path'] for case in final.search([0.0, 0.0, 1.0, 0.1], k=1)] == ['c.jpg']
+
+
+def test_float16_index_search_ranks_by_cosine_similarity(tmp_path):
+    index = CaseIndex.create(str(tmp_path / 'case_index'), dim=3, model_version='m')
+    index.append([[1, 0, 0], [1, 1, 0], [0, 0, 1]],
+                 [{'path': name, 'label': 'glioma'} for name in ('x.jpg', 'xy.jpg', 'z.jpg')])
+
+    results = index.search([2, 0.2, 0], k=3)
+
+    assert [case['path'] for case in results] == ['x.jpg', 'xy.jpg', 'z.jpg']
+    assert results[0]['similarity'] > 0.99
+    assert abs(results[2]['similarity']) < 1e-3